@@ -3,6 +3,7 @@
 
 import logging
 import os
+from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, Header, HTTPException
@@ -21,8 +22,20 @@ logging.basicConfig(
 log = logging.getLogger("reviewer-api")
 
 REVIEWER_API_TOKEN = os.getenv("REVIEWER_API_TOKEN", "")
+RAG_PRELOAD_MODEL = os.getenv("RAG_PRELOAD_MODEL", "1") == "1"
 
-app = FastAPI(title="mr-rag-reviewer", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Модель эмбеддингов грузится при старте, чтобы ревью (в т.ч. из main.py --server) не платили за холодный старт.
+    if RAG_PRELOAD_MODEL:
+        from rag import load_model
+
+        load_model()
+    yield
+
+
+app = FastAPI(title="mr-rag-reviewer", version="1.0.0", lifespan=lifespan)
 
 
 class ReviewRequest(BaseModel):
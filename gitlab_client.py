@@ -3,9 +3,9 @@
 
 import base64
 import logging
-from typing import Any
-
-import gitlab
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator
 
 log = logging.getLogger("gitlab")
 
@@ -20,9 +20,124 @@ def _to_dict(obj: Any) -> Any:
     return obj
 
 
+class _ByteBudget:
+    """Счётчик байт в работе: acquire ждёт, пока занятое + n не уложится в лимит."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, n: int, stop: threading.Event) -> bool:
+        with self._cond:
+            # Файл больше лимита всё равно пропускаем, когда бюджет свободен, иначе поток встанет навсегда.
+            while self.used and self.used + n > self.limit and not stop.is_set():
+                self._cond.wait(0.1)
+            if stop.is_set():
+                return False
+            self.used += n
+            return True
+
+    def release(self, n: int) -> None:
+        with self._cond:
+            self.used -= n
+            self._cond.notify_all()
+
+
+def iter_fetched(
+    fetch: Callable[[str], bytes],
+    files: Iterable[tuple[str, str | None]],
+    *,
+    workers: int = 8,
+    max_inflight_bytes: int = 32 * 1024 * 1024,
+) -> Iterator[tuple[str, str | None, str]]:
+    """Скачивает файлы в workers потоках и отдаёт (path, blob_sha, content) по мере готовности.
+
+    Скачанный файл занимает свой размер в байтах из max_inflight_bytes до тех пор, пока
+    потребитель не вернётся за следующим элементом (т.е. не обработает этот). При исчерпанном
+    бюджете потоки ждут, так что в памяти не больше max_inflight_bytes плюс по файлу на поток.
+    Недоступные файлы пропускаются; прочие ошибки потоков пробрасываются потребителю.
+    """
+    workers = max(1, workers)
+    todo = iter(files)
+    todo_lock = threading.Lock()
+    stop = threading.Event()
+    budget = _ByteBudget(max_inflight_bytes)
+    ready: queue.Queue = queue.Queue(maxsize=workers)
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        # Маркер конца отправляется всегда, иначе потребитель навсегда повиснет в ready.get().
+        try:
+            while not stop.is_set():
+                with todo_lock:
+                    item = next(todo, None)
+                if item is None:
+                    break
+                path, sha = item
+                try:
+                    raw = fetch(path)
+                except Exception as e:
+                    log.debug("raw file fetch failed: %s: %s", path, e)
+                    continue
+                content = raw.decode("utf-8", errors="replace")
+                if not budget.acquire(len(raw), stop):
+                    return
+                if not put((path, sha, content, len(raw))):
+                    return
+        except BaseException as e:
+            put(e)
+        finally:
+            put(None)
+
+    threads = [threading.Thread(target=produce, name=f"gitlab-raw-{i}", daemon=True) for i in range(workers)]
+    for t in threads:
+        t.start()
+    finished = 0
+    try:
+        while finished < workers:
+            item = ready.get()
+            if item is None:
+                finished += 1
+                continue
+            if isinstance(item, BaseException):
+                raise item
+            path, sha, content, size = item
+            try:
+                yield path, sha, content
+            finally:
+                budget.release(size)
+    finally:
+        stop.set()
+        while True:
+            try:
+                ready.get_nowait()
+            except queue.Empty:
+                break
+
+
 class GitLabClient:
-    def __init__(self, base_url: str, token: str):
+    def __init__(
+        self,
+        base_url: str,
+        token: str,
+        *,
+        fetch_workers: int = 8,
+        max_inflight_bytes: int = 32 * 1024 * 1024,
+    ):
         self.base_url = base_url.rstrip("/")
+        self.fetch_workers = max(1, fetch_workers)
+        self.max_inflight_bytes = max_inflight_bytes
+        import gitlab
+
         self._gl = gitlab.Gitlab(self.base_url, private_token=token)
         try:
             self._gl.auth()
@@ -72,6 +187,28 @@ class GitLabClient:
         content = base64.b64decode(f.content)
         return content.decode("utf-8", errors="replace")
 
+    def list_files(self, project_id: str, ref: str) -> list[tuple[str, str | None]]:
+        tree = self.get_repository_tree(project_id, ref)
+        return [
+            (node.get("path") or node.get("id"), node.get("id"))
+            for node in tree
+            if node.get("type") == "blob"
+        ]
+
+    def get_merge_request_diffs(self, project_id: str, mr_iid: int, mr: dict) -> tuple[list[dict], dict]:
+        changes = self.get_merge_request_changes(project_id, mr_iid)
+        return changes.get("changes", []), changes.get("diff_refs") or mr.get("diff_refs") or {}
+
+    def iter_files(
+        self, project_id: str, files: Iterable[tuple[str, str | None]], ref: str
+    ) -> Iterator[tuple[str, str | None, str]]:
+        project = self._gl.projects.get(project_id, lazy=True)
+
+        def fetch(path: str) -> bytes:
+            return project.files.raw(file_path=path, ref=ref)
+
+        return iter_fetched(fetch, files, workers=self.fetch_workers, max_inflight_bytes=self.max_inflight_bytes)
+
     def create_mr_discussion(self, project_id: str, mr_iid: int, body: str) -> dict:
         mr = self._mr(project_id, mr_iid)
         discussion = mr.discussions.create({"body": body})
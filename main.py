@@ -1,14 +1,21 @@
 # -*- coding: utf-8 -*-
-"""CLI запуск reviewer: python main.py --mr <IID> [--project <id>] [--gitlab-url <url>]"""
+"""CLI запуск reviewer: python main.py --mr <IID> [--project <id>] [--gitlab-url <url>]
+
+Если задан --server (или REVIEWER_URL), запрос пересылается в уже запущенный
+сервис (api.py), где модель эмбеддингов загружена заранее. Иначе ревью идёт
+в этом процессе; тяжёлые зависимости импортируются только в этом случае.
+"""
 
 import argparse
+import json
 import logging
 import os
+import sys
+import urllib.error
+import urllib.request
 
 from dotenv import load_dotenv
 
-from reviewer import run_review
-
 load_dotenv()
 
 LOG_LEVEL = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
@@ -17,6 +24,11 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
     level=LOG_LEVEL,
 )
+log = logging.getLogger("mr-reviewer-cli")
+
+REVIEWER_URL = os.getenv("REVIEWER_URL", "")
+REVIEWER_API_TOKEN = os.getenv("REVIEWER_API_TOKEN", "")
+REVIEWER_TIMEOUT = int(os.getenv("REVIEWER_TIMEOUT", "900"))
 
 
 def parse_args() -> argparse.Namespace:
@@ -24,12 +36,48 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--mr", type=int, required=True, help="Merge Request IID")
     parser.add_argument("--project", type=str, default=None, help="GitLab project id/path override")
     parser.add_argument("--gitlab-url", type=str, default=None, help="GitLab URL override")
+    parser.add_argument(
+        "--server",
+        type=str,
+        default=REVIEWER_URL or None,
+        help="URL запущенного reviewer-сервиса (по умолчанию REVIEWER_URL)",
+    )
+    parser.add_argument("--local", action="store_true", help="Ревью в этом процессе, даже если задан REVIEWER_URL")
     return parser.parse_args()
 
 
+def review_remote(server_url: str, mr_iid: int, project_id: str | None, gitlab_url: str | None) -> dict:
+    project_id = project_id or os.getenv("GITLAB_PROJECT_ID", "")
+    if not project_id:
+        raise RuntimeError("Укажите --project или GITLAB_PROJECT_ID")
+    payload = {"action": "review_mr", "project_id": project_id, "mr_iid": mr_iid, "gitlab_url": gitlab_url}
+    req = urllib.request.Request(
+        server_url.rstrip("/") + "/review",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json", "X-Reviewer-Token": REVIEWER_API_TOKEN},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=REVIEWER_TIMEOUT) as resp:
+            body = json.loads(resp.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        detail = e.read().decode("utf-8", errors="replace")
+        raise RuntimeError(f"reviewer вернул {e.code}: {detail}") from e
+    return body.get("result", body)
+
+
 def main() -> None:
     args = parse_args()
-    result = run_review(args.mr, project_id=args.project, gitlab_url=args.gitlab_url)
+    if args.server and not args.local:
+        log.info("Ревью через сервис %s", args.server)
+        try:
+            result = review_remote(args.server, args.mr, args.project, args.gitlab_url)
+        except (RuntimeError, OSError, ValueError) as e:
+            sys.exit(f"Ошибка: {e}")
+    else:
+        from reviewer import run_review
+
+        result = run_review(args.mr, project_id=args.project, gitlab_url=args.gitlab_url)
     print(result)
 
 
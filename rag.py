@@ -2,11 +2,16 @@
 """RAG по репозиторию: чанки файлов, эмбеддинги, поиск релевантного контекста."""
 
 import logging
-from sentence_transformers import SentenceTransformer
-from sentence_transformers.util import cos_sim
+import threading
+from collections import OrderedDict
+from typing import Iterable
+
+import numpy as np
 
 log = logging.getLogger("rag")
 
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+
 
 CODE_EXTENSIONS = {
     ".py", ".js", ".ts", ".tsx", ".jsx", ".vue", ".css", ".scss",
@@ -26,71 +31,268 @@ def skip_path(path: str) -> bool:
     return any(p in skip for p in parts)
 
 
-def chunk_text(text: str, path: str, max_chars: int = 1200) -> list[tuple[str, str]]:
+def chunk_lines(text: str, max_chars: int = 1200) -> list[tuple[str, int, int]]:
+    """Чанки (text, start, end) по строкам [start, end); соседние чанки перекрываются на 2 строки."""
     lines = text.split("\n")
     chunks = []
-    current = []
+    start = 0
     current_len = 0
-    for line in lines:
+    for i, line in enumerate(lines):
         line_len = len(line) + 1
-        if current_len + line_len > max_chars and current:
-            chunks.append(("\n".join(current), path))
-            overlap = current[-2:] if len(current) >= 2 else current
-            current = overlap
-            current_len = sum(len(l) + 1 for l in overlap)
-        current.append(line)
+        if current_len + line_len > max_chars and i > start:
+            chunks.append(("\n".join(lines[start:i]), start, i))
+            start = max(start, i - 2)
+            current_len = sum(len(l) + 1 for l in lines[start:i])
         current_len += line_len
-    if current:
-        chunks.append(("\n".join(current), path))
+    if start < len(lines):
+        chunks.append(("\n".join(lines[start:]), start, len(lines)))
     return chunks
 
 
+def merge_spans(spans: list[tuple[str, int, int]]) -> list[tuple[str, int, int]]:
+    """Склеивает перекрывающиеся и соседние чанки одного файла в непрерывные фрагменты."""
+    merged: list[tuple[str, int, int]] = []
+    for text, start, end in sorted(spans, key=lambda s: (s[1], s[2])):
+        if merged and start <= merged[-1][2]:
+            prev_text, prev_start, prev_end = merged[-1]
+            if end > prev_end:
+                tail = text.split("\n")[prev_end - start:]
+                prev_text = "\n".join([prev_text, *tail])
+            merged[-1] = (prev_text, prev_start, max(prev_end, end))
+        else:
+            merged.append((text, start, end))
+    return merged
+
+
+_models: dict = {}
+_models_lock = threading.Lock()
+
+
+def load_model(model_name: str = DEFAULT_MODEL):
+    """Модель эмбеддингов, одна на процесс. sentence_transformers (и torch) импортируются только здесь."""
+    model = _models.get(model_name)
+    if model is not None:
+        return model
+    with _models_lock:
+        if model_name not in _models:
+            from sentence_transformers import SentenceTransformer
+
+            log.info("Загрузка модели эмбеддингов: %s", model_name)
+            _models[model_name] = SentenceTransformer(model_name)
+        return _models[model_name]
+
+
+class BlobEmbeddingCache:
+    """LRU чанков (text, start, end) и эмбеддингов по SHA блоба; ограничен суммарным числом чанков.
+
+    Эмбеддинги нормализованы и хранятся копиями, чтобы запись не удерживала матрицу всего индекса.
+    """
+
+    def __init__(self, max_chunks: int = 50000):
+        self.max_chunks = max_chunks
+        self._items: OrderedDict[tuple[str, str], tuple[list[tuple[str, int, int]], np.ndarray]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str, sha: str) -> tuple[list[tuple[str, int, int]], np.ndarray] | None:
+        with self._lock:
+            item = self._items.get((model_name, sha))
+            if item is not None:
+                self._items.move_to_end((model_name, sha))
+            return item
+
+    def put(self, model_name: str, sha: str, chunks: list[tuple[str, int, int]], embeddings: np.ndarray) -> None:
+        if len(chunks) > self.max_chunks:
+            return
+        with self._lock:
+            old = self._items.pop((model_name, sha), None)
+            if old is not None:
+                self._size -= len(old[0])
+            self._items[(model_name, sha)] = (chunks, embeddings)
+            self._size += len(chunks)
+            while self._size > self.max_chunks:
+                _, (evicted, _) = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+
 class RepoRAG:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        log.info("Загрузка модели эмбеддингов: %s", model_name)
-        self.model = SentenceTransformer(model_name)
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL,
+        batch_size: int = 64,
+        blob_cache: BlobEmbeddingCache | None = None,
+    ):
+        self.model_name = model_name
+        self.model = load_model(model_name)
+        self.batch_size = max(1, batch_size)
+        self.blob_cache = blob_cache
         self.chunks: list[tuple[str, str]] = []
+        self.spans: list[tuple[int, int]] = []
         self.embeddings = None
+        self._emb_buf = None
+        self._emb_len = 0
+
+    def _append_embeddings(self, emb: np.ndarray) -> None:
+        """Дописывает батч в буфер эмбеддингов, удваивая ёмкость при нехватке."""
+        n = len(emb)
+        if self._emb_buf is None:
+            self._emb_buf = np.empty((max(n, self.batch_size), emb.shape[1]), dtype=emb.dtype)
+        elif self._emb_len + n > len(self._emb_buf):
+            capacity = max(self._emb_len + n, 2 * len(self._emb_buf))
+            grown = np.empty((capacity, self._emb_buf.shape[1]), dtype=self._emb_buf.dtype)
+            grown[: self._emb_len] = self._emb_buf[: self._emb_len]
+            self._emb_buf = grown
+        self._emb_buf[self._emb_len : self._emb_len + n] = emb
+        self._emb_len += n
+
+    def _flush(self, texts: list[str]) -> None:
+        if not texts:
+            return
+        emb = self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False)
+        self._append_embeddings(emb)
+        texts.clear()
+
+    def split_cached(
+        self, files: Iterable[tuple[str, str | None]]
+    ) -> tuple[list[tuple[str, tuple[list[tuple[str, int, int]], np.ndarray]]], list[tuple[str, str | None]]]:
+        """Делит (path, blob_sha) на найденные в blob_cache (path, (chunks, embeddings)) и те, что надо скачать.
+
+        Кеш опрашивается один раз на файл: взятые записи остаются у вызывающего,
+        даже если параллельное ревью вытеснит их из кеша.
+        """
+        cached = []
+        to_fetch = []
+        for path, sha in files:
+            entry = self.blob_cache.get(self.model_name, sha) if self.blob_cache and sha else None
+            if entry is not None:
+                cached.append((path, entry))
+            else:
+                to_fetch.append((path, sha))
+        return cached, to_fetch
+
+    def index_stream(
+        self,
+        file_contents: Iterable[tuple[str, str | None, str | bytes]],
+        cached: Iterable[tuple[str, tuple[list[tuple[str, int, int]], np.ndarray]]] = (),
+    ) -> None:
+        """Индексирует записи из cached (см. split_cached), затем (path, blob_sha, content) по мере поступления.
 
-    def index_files(self, file_contents: list[tuple[str, str]]) -> None:
+        Чанки кодируются батчами по batch_size, эмбеддинги дописываются в общую матрицу,
+        так что источник может ещё догружать файлы.
+        """
         self.chunks = []
-        for path, content in file_contents:
+        self.spans = []
+        self.embeddings = None
+        self._emb_buf = None
+        self._emb_len = 0
+        pending: list[str] = []
+        encoded: list[tuple[str, int, int]] = []
+        for path, (file_chunks, emb) in cached:
+            for text, start, end in file_chunks:
+                self.chunks.append((text, path))
+                self.spans.append((start, end))
+            if len(emb):
+                self._append_embeddings(emb)
+        from_cache = len(self.chunks)
+        for path, sha, content in file_contents:
             if not is_code_file(path) or skip_path(path):
                 continue
             try:
                 if isinstance(content, bytes):
                     content = content.decode("utf-8", errors="replace")
-                for chunk, chunk_path in chunk_text(content, path):
-                    self.chunks.append((chunk, chunk_path))
+                file_chunks = chunk_lines(content)
             except Exception:
                 continue
+            start = len(self.chunks)
+            for chunk, line_start, line_end in file_chunks:
+                self.chunks.append((chunk, path))
+                self.spans.append((line_start, line_end))
+                pending.append(chunk)
+                if len(pending) >= self.batch_size:
+                    self._flush(pending)
+            if sha and self.blob_cache:
+                encoded.append((sha, start, len(self.chunks)))
+        self._flush(pending)
         if not self.chunks:
-            self.embeddings = None
             log.warning("Нет чанков для индексации")
             return
-        texts = [c[0] for c in self.chunks]
-        self.embeddings = self.model.encode(texts, show_progress_bar=len(texts) > 50)
-        log.info("Индекс RAG: чанков=%s", len(self.chunks))
+        # Буфер обрезается до заполненной части и нормализуется на месте; select работает по этой матрице.
+        emb = self._emb_buf if len(self._emb_buf) == self._emb_len else self._emb_buf[: self._emb_len].copy()
+        self._emb_buf = None
+        emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+        self.embeddings = emb
+        for sha, start, end in encoded:
+            file_chunks = [(text, *span) for (text, _), span in zip(self.chunks[start:end], self.spans[start:end])]
+            self.blob_cache.put(self.model_name, sha, file_chunks, emb[start:end].copy())
+        log.info("Индекс RAG: чанков=%s, из кеша=%s", len(self.chunks), from_cache)
+
+    def select(
+        self,
+        query: str,
+        max_tokens: int,
+        *,
+        chars_per_token: int = 3,
+        top_k: int | None = None,
+        changed_paths: Iterable[str] = (),
+        changed_weight: float = 0.5,
+        mmr_lambda: float = 0.7,
+        dedup_threshold: float = 0.95,
+        pool_size: int = 64,
+    ) -> list[tuple[str, str]]:
+        """Подбирает контекст под бюджет токенов.
 
-    def retrieve(self, query: str, top_k: int = 12) -> list[tuple[str, str]]:
-        if not self.chunks or self.embeddings is None:
+        Кандидаты — pool_size лучших по косинусу чанков; релевантность чанков из changed_paths
+        умножается на changed_weight (<= 0 — исключить). Порядок выбора — MMR, почти дубликаты
+        уже выбранных (косинус выше dedup_threshold) отбрасываются. Перекрывающиеся и соседние
+        чанки одного файла склеиваются, и чанк берётся, только если склейка влезает в бюджет.
+        """
+        if not self.chunks or self.embeddings is None or max_tokens <= 0:
             return []
-        q_emb = self.model.encode([query])
-        sim = cos_sim(self.embeddings, q_emb)
-        if hasattr(sim, "cpu"):
-            sim = sim.cpu().numpy()
-        scores = sim.ravel()
-        indices = scores.argsort()[-top_k:][::-1]
-        seen_paths = set()
-        result = []
-        for i in indices:
-            text, path = self.chunks[i]
-            if path not in seen_paths or len(result) < top_k // 2:
-                result.append((text, path))
-                seen_paths.add(path)
-            if len(result) >= top_k:
-                break
-        return result
+        q_emb = self.model.encode([query], convert_to_numpy=True)[0]
+        relevance = self.embeddings @ (q_emb / max(float(np.linalg.norm(q_emb)), 1e-12))
+        changed = set(changed_paths)
+        if changed:
+            mask = np.fromiter((path in changed for _, path in self.chunks), dtype=bool, count=len(self.chunks))
+            if changed_weight <= 0:
+                relevance = np.where(mask, -np.inf, relevance)
+            else:
+                relevance = np.where(mask & (relevance > 0), relevance * changed_weight, relevance)
+        pool = np.argsort(-relevance)[:pool_size]
+        pool = pool[np.isfinite(relevance[pool])]
+        if not len(pool):
+            return []
+
+        rel = relevance[pool]
+        pool_vecs = self.embeddings[pool]
+        pair_sim = pool_vecs @ pool_vecs.T
+        max_sim = np.zeros(len(pool))
+        alive = np.ones(len(pool), dtype=bool)
+        budget = max_tokens * chars_per_token
+        by_path: dict[str, list[tuple[str, int, int]]] = {}
+        used = 0
+        taken = 0
+        while alive.any() and (top_k is None or taken < top_k):
+            score = np.where(alive, mmr_lambda * rel - (1 - mmr_lambda) * max_sim, -np.inf)
+            j = int(np.argmax(score))
+            alive[j] = False
+            if max_sim[j] > dedup_threshold:
+                continue
+            text, path = self.chunks[pool[j]]
+            start, end = self.spans[pool[j]]
+            spans = by_path.get(path, [])
+            merged = merge_spans([*spans, (text, start, end)])
+            if merged == spans:
+                # Чанк целиком внутри уже выбранного фрагмента — контекст не растёт, слот top_k не тратим.
+                continue
+            # Стоимость — прирост отформатированного контекста (заголовок "--- path ---" на каждый фрагмент).
+            cost = sum(len(t) + len(path) + 11 for t, _, _ in merged) - sum(len(t) + len(path) + 11 for t, _, _ in spans)
+            if used + cost > budget:
+                continue
+            used += cost
+            taken += 1
+            by_path[path] = merged
+            max_sim = np.maximum(max_sim, pair_sim[:, j])
+        return [(text, path) for path, spans in by_path.items() for text, _, _ in spans]
 
     def format_context(self, chunks: list[tuple[str, str]]) -> str:
         out = []
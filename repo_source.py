@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""Источники содержимого репозитория: GitLab API (GitLabClient) или локальное bare-зеркало."""
+
+import base64
+import hashlib
+import logging
+import os
+import re
+import subprocess
+import threading
+from typing import Iterable, Iterator, Protocol
+
+log = logging.getLogger("repo-source")
+
+
+class RepoSource(Protocol):
+    def list_files(self, project_id: str, ref: str) -> list[tuple[str, str | None]]:
+        """Файлы ref в виде (path, blob_sha)."""
+
+    def iter_files(
+        self, project_id: str, files: Iterable[tuple[str, str | None]], ref: str
+    ) -> Iterator[tuple[str, str | None, str]]:
+        """Содержимое файлов (path, blob_sha, content) по мере готовности."""
+
+    def get_merge_request_diffs(self, project_id: str, mr_iid: int, mr: dict) -> tuple[list[dict], dict]:
+        """Изменения MR в формате поля changes из GitLab API и diff_refs, по которым они построены."""
+
+
+_mirror_locks: dict[str, threading.Lock] = {}
+_mirror_locks_guard = threading.Lock()
+
+
+def _mirror_lock(path: str) -> threading.Lock:
+    with _mirror_locks_guard:
+        return _mirror_locks.setdefault(path, threading.Lock())
+
+
+_QUOTE_ESCAPES = {"\a": "a", "\b": "b", "\t": "t", "\n": "n", "\v": "v", "\f": "f", "\r": "r", '"': '"', "\\": "\\"}
+
+
+def _git_quote(path: str) -> str:
+    """Путь так, как git пишет его в заголовке патча при core.quotePath=false."""
+    if not any(c in _QUOTE_ESCAPES or ord(c) < 0x20 or ord(c) == 0x7F for c in path):
+        return path
+    out = []
+    for c in path:
+        if c in _QUOTE_ESCAPES:
+            out.append("\\" + _QUOTE_ESCAPES[c])
+        elif ord(c) < 0x20 or ord(c) == 0x7F:
+            out.append(f"\\{ord(c):03o}")
+        else:
+            out.append(c)
+    return '"' + "".join(out) + '"'
+
+
+class GitMirrorSource:
+    """Bare-зеркало проекта в root_dir, обновляемое git fetch.
+
+    Блобы и diff MR читаются напрямую из объектов git. remote_url может быть
+    и локальным путём к репозиторию.
+    """
+
+    def __init__(self, root_dir: str, remote_url: str, token: str = ""):
+        self.root_dir = root_dir
+        self.remote_url = remote_url
+        self.token = token
+        self._synced: set[str] = set()
+
+    def _mirror_path(self, project_id: str) -> str:
+        # Один и тот же project_id на разных инстансах GitLab — разные зеркала.
+        name = re.sub(r"[^A-Za-z0-9._-]+", "_", str(project_id)).strip("_") or "project"
+        remote_hash = hashlib.sha1(self.remote_url.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.root_dir, f"{name}-{remote_hash}.git")
+
+    def _auth_env(self) -> dict[str, str] | None:
+        """Токен передаётся через GIT_CONFIG_* в окружении, а не в argv, и только для сетевых команд."""
+        if not self.token or not self.remote_url.startswith(("http://", "https://")):
+            return None
+        basic = base64.b64encode(f"oauth2:{self.token}".encode()).decode()
+        return {
+            **os.environ,
+            "GIT_CONFIG_COUNT": "1",
+            "GIT_CONFIG_KEY_0": "http.extraHeader",
+            "GIT_CONFIG_VALUE_0": f"Authorization: Basic {basic}",
+        }
+
+    @staticmethod
+    def _run(what: str, cmd: list[str], env: dict[str, str] | None = None) -> bytes:
+        proc = subprocess.run(cmd, capture_output=True, check=False, env=env)
+        if proc.returncode != 0:
+            raise RuntimeError(f"git {what}: {proc.stderr.decode(errors='replace').strip()}")
+        return proc.stdout
+
+    def _git(self, project_id: str, *args: str) -> bytes:
+        cmd = ["git", "-c", "core.quotePath=false", "--git-dir", self._mirror_path(project_id), *args]
+        return self._run(args[0], cmd)
+
+    def sync(self, project_id: str) -> None:
+        """Создаёт зеркало при первом обращении, иначе подтягивает изменения."""
+        path = self._mirror_path(project_id)
+        with _mirror_lock(path):
+            if not os.path.isdir(path):
+                os.makedirs(self.root_dir, exist_ok=True)
+                log.info("git clone --mirror %s -> %s", self.remote_url, path)
+                self._run("clone", ["git", "clone", "--mirror", "--quiet", self.remote_url, path], env=self._auth_env())
+            else:
+                self._run(
+                    "fetch",
+                    ["git", "--git-dir", path, "fetch", "--prune", "--quiet", "origin"],
+                    env=self._auth_env(),
+                )
+        self._synced.add(project_id)
+
+    def _ensure_synced(self, project_id: str) -> None:
+        if project_id not in self._synced:
+            self.sync(project_id)
+
+    def list_files(self, project_id: str, ref: str) -> list[tuple[str, str | None]]:
+        self._ensure_synced(project_id)
+        out = self._git(project_id, "ls-tree", "-r", "-z", "--full-tree", ref)
+        files = []
+        for entry in out.split(b"\0"):
+            if not entry:
+                continue
+            meta, _, path = entry.partition(b"\t")
+            _mode, obj_type, sha = meta.split(b" ")
+            if obj_type == b"blob":
+                files.append((path.decode("utf-8", errors="replace"), sha.decode()))
+        return files
+
+    def iter_files(
+        self, project_id: str, files: Iterable[tuple[str, str | None]], ref: str
+    ) -> Iterator[tuple[str, str | None, str]]:
+        """Читает блобы одним процессом git cat-file --batch."""
+        self._ensure_synced(project_id)
+        proc = subprocess.Popen(
+            ["git", "--git-dir", self._mirror_path(project_id), "cat-file", "--batch"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        try:
+            for path, sha in files:
+                spec = sha or f"{ref}:{path}"
+                proc.stdin.write(spec.encode() + b"\n")
+                proc.stdin.flush()
+                header = proc.stdout.readline().split()
+                if len(header) != 3:
+                    log.debug("blob not found: %s", spec)
+                    continue
+                size = int(header[2])
+                raw = proc.stdout.read(size)
+                proc.stdout.read(1)
+                yield path, header[0].decode(), raw.decode("utf-8", errors="replace")
+        finally:
+            proc.stdin.close()
+            proc.stdout.close()
+            proc.wait()
+
+    def get_merge_request_diffs(self, project_id: str, mr_iid: int, mr: dict) -> tuple[list[dict], dict]:
+        diff_refs = mr.get("diff_refs") or {}
+        base_sha = diff_refs.get("base_sha")
+        head_sha = diff_refs.get("head_sha")
+        if not base_sha or not head_sha:
+            raise RuntimeError(f"У MR !{mr_iid} нет diff_refs")
+        self._ensure_synced(project_id)
+        out = self._git(project_id, "diff", "--raw", "-p", "-z", "-M", "--no-color", "--no-ext-diff", base_sha, head_sha)
+        # Сначала записи --raw (поля через NUL, в конце лишний NUL), затем патчи в том же порядке.
+        raw_end = out.find(b"\0\0")
+        if raw_end < 0:
+            return [], diff_refs
+        fields = [f.decode("utf-8", errors="replace") for f in out[:raw_end].split(b"\0")]
+        patches = re.split(r"(?m)^diff --git ", out[raw_end + 2:].decode("utf-8", errors="replace"))[1:]
+        diffs = []
+        by_header: dict[str, dict] = {}
+        i = 0
+        while i < len(fields):
+            status = fields[i].split()[-1]
+            if status[0] in "RC":
+                old_path, new_path = fields[i + 1], fields[i + 2]
+                i += 3
+            else:
+                old_path = new_path = fields[i + 1]
+                i += 2
+            diff = {
+                "old_path": old_path,
+                "new_path": new_path,
+                "new_file": status == "A",
+                "renamed_file": status[0] == "R",
+                "deleted_file": status == "D",
+                "diff": "",
+            }
+            diffs.append(diff)
+            by_header[f"{_git_quote('a/' + old_path)} {_git_quote('b/' + new_path)}"] = diff
+        # Патч сопоставляется с файлом по заголовку: у смены типа (T) одна запись --raw, но два патча.
+        for patch in patches:
+            diff = by_header.get(patch.split("\n", 1)[0])
+            hunks_at = patch.find("\n@@")
+            if diff is not None and hunks_at >= 0:
+                diff["diff"] += patch[hunks_at + 1:]
+        return diffs, diff_refs
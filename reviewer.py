@@ -5,10 +5,10 @@ import logging
 import os
 import re
 from dotenv import load_dotenv
-from openai import OpenAI
 
 from gitlab_client import GitLabClient
-from rag import RepoRAG, is_code_file, skip_path
+from rag import BlobEmbeddingCache, RepoRAG, is_code_file, skip_path
+from repo_source import GitMirrorSource, RepoSource
 
 load_dotenv()
 
@@ -22,8 +22,20 @@ LM_MODEL = os.getenv("LM_MODEL", "openai/gpt-oss-20b")
 LM_MAX_CTX = int(os.getenv("LM_MAX_CTX", "4096"))
 CHARS_PER_TOKEN = 3
 RAG_TOP_K = int(os.getenv("RAG_TOP_K", "12"))
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "5000"))
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+RAG_DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.95"))
+RAG_CHANGED_FILE_WEIGHT = float(os.getenv("RAG_CHANGED_FILE_WEIGHT", "0.5"))
+RAG_FETCH_WORKERS = int(os.getenv("RAG_FETCH_WORKERS", "8"))
+RAG_MAX_INFLIGHT_MB = int(os.getenv("RAG_MAX_INFLIGHT_MB", "32"))
+RAG_EMBED_BATCH = int(os.getenv("RAG_EMBED_BATCH", "64"))
+RAG_BLOB_CACHE_CHUNKS = int(os.getenv("RAG_BLOB_CACHE_CHUNKS", "50000"))
+REPO_SOURCE = os.getenv("REPO_SOURCE", "api").lower()
+GIT_MIRROR_DIR = os.getenv("GIT_MIRROR_DIR", "/data/mirrors")
 FILE_SECTION_MARKER = "## Файл: "
 
+BLOB_CACHE = BlobEmbeddingCache(RAG_BLOB_CACHE_CHUNKS)
+
 
 def first_new_line_from_diff(diff_text: str) -> int | None:
     for line in diff_text.splitlines():
@@ -122,6 +134,21 @@ def build_prompt(changed_paths_str: str, rag_context: str, title: str, descripti
     return system, user_content
 
 
+def make_repo_source(client: GitLabClient, project_id: str, gitlab_url: str) -> RepoSource:
+    """REPO_SOURCE=git — локальное зеркало в GIT_MIRROR_DIR, иначе (и при ошибке зеркала) GitLab API."""
+    if REPO_SOURCE != "git":
+        return client
+    try:
+        project = client.get_project(project_id)
+        remote_url = f"{gitlab_url}/{project['path_with_namespace']}.git"
+        source = GitMirrorSource(GIT_MIRROR_DIR, remote_url, GITLAB_TOKEN)
+        source.sync(project_id)
+        return source
+    except Exception as e:
+        log.warning("Git-зеркало недоступно, используется API: %s", e)
+        return client
+
+
 def run_review(mr_iid: int, project_id: str | None = None, gitlab_url: str | None = None) -> dict:
     effective_project_id = project_id or PROJECT_ID
     effective_gitlab_url = (gitlab_url or GITLAB_URL).rstrip("/")
@@ -130,13 +157,25 @@ def run_review(mr_iid: int, project_id: str | None = None, gitlab_url: str | Non
     if not effective_project_id:
         raise RuntimeError("Укажите GITLAB_PROJECT_ID")
 
-    client = GitLabClient(effective_gitlab_url, GITLAB_TOKEN)
+    client = GitLabClient(
+        effective_gitlab_url,
+        GITLAB_TOKEN,
+        fetch_workers=RAG_FETCH_WORKERS,
+        max_inflight_bytes=RAG_MAX_INFLIGHT_MB * 1024 * 1024,
+    )
     mr = client.get_merge_request(effective_project_id, mr_iid)
-    changes = client.get_merge_request_changes(effective_project_id, mr_iid)
+    source = make_repo_source(client, effective_project_id, effective_gitlab_url)
+    try:
+        diffs, diff_refs = source.get_merge_request_diffs(effective_project_id, mr_iid, mr)
+    except Exception as e:
+        if source is client:
+            raise
+        # Зеркало может не знать коммитов MR (форк, push после fetch) — diff берём из API.
+        log.warning("Diff MR из зеркала недоступен, используется API: %s", e)
+        diffs, diff_refs = client.get_merge_request_diffs(effective_project_id, mr_iid, mr)
 
     title = mr.get("title", "")
     description = mr.get("description") or ""
-    diffs = changes.get("changes", [])
     diff_text = ""
     for d in diffs:
         diff_text += f"\n--- {d.get('new_path') or d.get('old_path')} ---\n"
@@ -146,40 +185,46 @@ def run_review(mr_iid: int, project_id: str | None = None, gitlab_url: str | Non
     rag_ref = mr.get("target_branch") or "main"
     log.info("RAG ref branch: %s", rag_ref)
     try:
-        tree = client.get_repository_tree(effective_project_id, rag_ref)
+        files = source.list_files(effective_project_id, rag_ref)
     except Exception as e:
         log.warning("Дерево репозитория недоступно: %s", e)
-        tree = []
-
-    file_contents = []
-    for node in tree:
-        path = node.get("path") or node.get("id")
-        if node.get("type") != "blob":
-            continue
-        if not is_code_file(path) or skip_path(path):
-            continue
-        try:
-            content = client.get_file_raw(effective_project_id, path, rag_ref)
-            file_contents.append((path, content))
-        except Exception:
-            continue
-
-    rag = RepoRAG()
-    rag.index_files(file_contents)
+        files = []
+    files = [(path, sha) for path, sha in files if is_code_file(path) and not skip_path(path)]
+
+    # Файлы индексируются по мере скачивания: сеть, чанкинг и модель работают внахлёст.
+    # Блобы, уже закодированные в прошлых ревью, берутся из кеша по SHA и не скачиваются.
+    rag = RepoRAG(batch_size=RAG_EMBED_BATCH, blob_cache=BLOB_CACHE)
+    cached, to_fetch = rag.split_cached(files)
+    rag.index_stream(source.iter_files(effective_project_id, to_fetch, rag_ref), cached=cached)
     query = f"{title}\n{description}\n{diff_text}"[:8000]
-    chunks = rag.retrieve(query, top_k=RAG_TOP_K)
-    rag_context = rag.format_context(chunks)
     changed_paths = [d.get("new_path") or d.get("old_path") for d in diffs if d.get("new_path") or d.get("old_path")]
     changed_paths_str = "\n".join(f"- {p}" for p in changed_paths)
 
-    system_prompt, user_prompt = build_prompt(changed_paths_str, rag_context, title, description, diff_text)
+    # Контекст RAG заполняет то, что осталось от окна модели после системного промпта, MR и diff.
+    system_prompt, user_prompt = build_prompt(changed_paths_str, "", title, description, diff_text)
     max_completion_tokens = min(2000, max(256, LM_MAX_CTX // 2))
     max_prompt_chars = (LM_MAX_CTX - max_completion_tokens) * CHARS_PER_TOKEN
     max_user_chars = max(500, max_prompt_chars - len(system_prompt))
+    rag_budget_tokens = min(RAG_CONTEXT_TOKENS, max(0, max_user_chars - len(user_prompt)) // CHARS_PER_TOKEN)
+    chunks = rag.select(
+        query,
+        rag_budget_tokens,
+        chars_per_token=CHARS_PER_TOKEN,
+        top_k=RAG_TOP_K,
+        changed_paths={p for d in diffs for p in (d.get("new_path"), d.get("old_path")) if p},
+        changed_weight=RAG_CHANGED_FILE_WEIGHT,
+        mmr_lambda=RAG_MMR_LAMBDA,
+        dedup_threshold=RAG_DEDUP_THRESHOLD,
+    )
+    rag_context = rag.format_context(chunks)
+
+    system_prompt, user_prompt = build_prompt(changed_paths_str, rag_context, title, description, diff_text)
     if len(user_prompt) > max_user_chars:
         user_prompt = user_prompt[:max_user_chars]
         log.warning("Промпт обрезан до лимита модели")
 
+    from openai import OpenAI
+
     openai_client = OpenAI(base_url=LM_BASE_URL, api_key="lm-studio")
     resp = openai_client.chat.completions.create(
         model=LM_MODEL,
@@ -193,7 +238,6 @@ def run_review(mr_iid: int, project_id: str | None = None, gitlab_url: str | Non
     review = (resp.choices[0].message.content or "").strip() or "*Пустой ответ модели.*"
     general_text, file_comments = parse_review_by_file(review)
 
-    diff_refs = changes.get("diff_refs") or mr.get("diff_refs") or {}
     base_sha = diff_refs.get("base_sha")
     start_sha = diff_refs.get("start_sha")
     head_sha = diff_refs.get("head_sha")
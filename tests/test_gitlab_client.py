@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from gitlab_client import iter_fetched
+
+
+def test_iter_fetched_yields_all_and_skips_failures():
+    def fetch(path: str) -> bytes:
+        if path == "bad.py":
+            raise IOError("404")
+        return path.encode()
+
+    files = [(f"f{i}.py", f"sha{i}") for i in range(20)] + [("bad.py", None)]
+    got = list(iter_fetched(fetch, files, workers=4, max_inflight_bytes=1024))
+    assert sorted(got) == sorted((p, s, p) for p, s in files if p != "bad.py")
+
+
+def test_iter_fetched_bounds_unconsumed_bytes():
+    size, limit, workers = 100, 300, 3
+    lock = threading.Lock()
+    held = 0
+    peak = 0
+
+    def fetch(path: str) -> bytes:
+        nonlocal held, peak
+        with lock:
+            held += size
+            peak = max(peak, held)
+        return b"x" * size
+
+    for _ in iter_fetched(fetch, [(str(i), None) for i in range(30)], workers=workers, max_inflight_bytes=limit):
+        time.sleep(0.01)
+        with lock:
+            held -= size
+    assert peak <= limit + workers * size
+
+
+def test_iter_fetched_close_stops_producers():
+    fetched = []
+    gen = iter_fetched(lambda p: fetched.append(p) or b"x" * 10, [(str(i), None) for i in range(1000)], workers=2, max_inflight_bytes=20)
+    next(gen)
+    gen.close()
+    time.sleep(0.3)
+    count = len(fetched)
+    time.sleep(0.3)
+    assert len(fetched) == count < 1000
+
+
+def test_iter_fetched_raises_producer_errors():
+    def files():
+        yield "a.py", None
+        raise ValueError("broken listing")
+
+    with pytest.raises(ValueError, match="broken listing"):
+        list(iter_fetched(lambda p: b"x", files(), workers=1))
+
+
+def test_iter_fetched_raises_on_non_bytes_fetch():
+    with pytest.raises(AttributeError):
+        list(iter_fetched(lambda p: "not bytes", [("a.py", None), ("b.py", None)], workers=2))
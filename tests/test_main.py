@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import main
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_entry_points_do_not_import_heavy_dependencies():
+    code = (
+        "import sys, main, reviewer, api; "
+        "print(','.join(m for m in ('sentence_transformers', 'torch', 'openai', 'gitlab') if m in sys.modules))"
+    )
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert proc.stdout.strip() == ""
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        mode = self.path.strip("/").split("/")[0]
+        if mode == "slow":
+            time.sleep(1)
+        status, body = {
+            "ok": (200, json.dumps({"status": "ok", "result": {"mr_iid": 2}})),
+            "fail": (500, json.dumps({"detail": "boom"})),
+            "garbage": (200, "<html>not json</html>"),
+            "slow": (200, "{}"),
+        }[mode]
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def run_main(monkeypatch, url: str) -> None:
+    monkeypatch.setattr(sys, "argv", ["main.py", "--mr", "2", "--project", "1", "--server", url])
+    main.main()
+
+
+def test_review_remote_returns_result(server):
+    assert main.review_remote(f"{server}/ok", 2, "1", None) == {"mr_iid": 2}
+
+
+def test_review_remote_http_error(server, monkeypatch):
+    with pytest.raises(RuntimeError, match="500"):
+        main.review_remote(f"{server}/fail", 2, "1", None)
+    with pytest.raises(SystemExit):
+        run_main(monkeypatch, f"{server}/fail")
+
+
+def test_review_remote_timeout_exits(server, monkeypatch):
+    monkeypatch.setattr(main, "REVIEWER_TIMEOUT", 0.2)
+    with pytest.raises(SystemExit):
+        run_main(monkeypatch, f"{server}/slow")
+
+
+def test_review_remote_non_json_exits(server, monkeypatch):
+    with pytest.raises(SystemExit):
+        run_main(monkeypatch, f"{server}/garbage")
+
+
+def test_review_remote_unreachable_exits(monkeypatch):
+    with pytest.raises(SystemExit):
+        run_main(monkeypatch, "http://127.0.0.1:9")
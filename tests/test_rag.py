@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import random
+
+import numpy as np
+import pytest
+
+import rag
+from rag import BlobEmbeddingCache, RepoRAG, chunk_lines, merge_spans
+
+
+def entry(n: int) -> tuple[list[tuple[str, int, int]], np.ndarray]:
+    return [(f"c{i}", i, i + 1) for i in range(n)], np.zeros((n, 4), dtype=np.float32)
+
+
+def test_blob_cache_evicts_lru_by_chunk_count():
+    cache = BlobEmbeddingCache(max_chunks=5)
+    cache.put("m", "a", *entry(2))
+    cache.put("m", "b", *entry(2))
+    assert cache.get("m", "a") is not None
+    cache.put("m", "c", *entry(2))
+    assert cache.get("m", "b") is None
+    assert cache.get("m", "a") is not None and cache.get("m", "c") is not None
+
+
+def test_blob_cache_keys_by_model_and_skips_oversized():
+    cache = BlobEmbeddingCache(max_chunks=3)
+    cache.put("m1", "a", *entry(1))
+    assert cache.get("m2", "a") is None
+    cache.put("m1", "big", *entry(4))
+    assert cache.get("m1", "big") is None and cache.get("m1", "a") is not None
+
+
+def legacy_chunk_text(text: str, max_chars: int) -> list[str]:
+    """Прежняя реализация chunk_text: chunk_lines должен резать так же."""
+    chunks = []
+    current = []
+    current_len = 0
+    for line in text.split("\n"):
+        line_len = len(line) + 1
+        if current_len + line_len > max_chars and current:
+            chunks.append("\n".join(current))
+            current = current[-2:] if len(current) >= 2 else current
+            current_len = sum(len(l) + 1 for l in current)
+        current.append(line)
+        current_len += line_len
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def test_chunk_lines_matches_legacy_and_spans():
+    rnd = random.Random(0)
+    for _ in range(500):
+        text = "\n".join("x" * rnd.randint(0, 80) for _ in range(rnd.randint(0, 60)))
+        max_chars = rnd.randint(1, 300)
+        chunks = chunk_lines(text, max_chars)
+        assert [c for c, _, _ in chunks] == legacy_chunk_text(text, max_chars)
+        lines = text.split("\n")
+        for chunk, start, end in chunks:
+            assert chunk == "\n".join(lines[start:end])
+        merged = merge_spans(chunks)
+        assert merged == [("\n".join(lines), 0, len(lines))]
+
+
+def test_merge_spans_keeps_gaps_and_contained_chunks():
+    lines = [f"l{i}" for i in range(10)]
+    span = lambda s, e: ("\n".join(lines[s:e]), s, e)
+    assert merge_spans([span(6, 8), span(0, 3), span(1, 2), span(3, 5)]) == [span(0, 5), span(6, 8)]
+
+
+class StubModel:
+    """Эмбеддинг — мешок слов по словарю VOCAB."""
+
+    VOCAB = ["alpha", "beta", "gamma", "delta", "eps"]
+
+    def encode(self, texts, **kwargs):
+        return np.array([[t.count(w) + 0.01 for w in self.VOCAB] for t in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def stub_rag(monkeypatch):
+    monkeypatch.setattr(rag, "load_model", lambda name=rag.DEFAULT_MODEL: StubModel())
+    return RepoRAG(batch_size=3, blob_cache=BlobEmbeddingCache(1000))
+
+
+def long_file(word: str, n: int = 120) -> str:
+    return "\n".join(f"{word} line {i:03d}" for i in range(n))
+
+
+def test_index_stream_normalizes_single_matrix_and_reuses_cache(stub_rag):
+    files = [("a.py", "sa", long_file("alpha")), ("b.py", "sb", long_file("beta")), ("c.txt", "sc", "alpha")]
+    stub_rag.index_stream(iter(files))
+    assert len(stub_rag.embeddings) == len(stub_rag.chunks) == len(stub_rag.spans)
+    assert np.allclose(np.linalg.norm(stub_rag.embeddings, axis=1), 1)
+    assert {p for _, p in stub_rag.chunks} == {"a.py", "b.py"}
+
+    again = RepoRAG(batch_size=3, blob_cache=stub_rag.blob_cache)
+    cached, to_fetch = again.split_cached([("a.py", "sa"), ("b.py", "sb"), ("d.py", "sd")])
+    assert [p for p, _ in cached] == ["a.py", "b.py"] and to_fetch == [("d.py", "sd")]
+    assert all(emb.base is None for _, (_, emb) in cached)
+    again.index_stream(iter([]), cached=cached)
+    assert np.allclose(again.embeddings, stub_rag.embeddings) and again.spans == stub_rag.spans
+
+
+def test_select_respects_budget_and_merges(stub_rag):
+    stub_rag.index_stream(iter([("a.py", None, long_file("alpha")), ("b.py", None, long_file("beta"))]))
+    selected = stub_rag.select("alpha", max_tokens=300, chars_per_token=3, dedup_threshold=1.1)
+    assert selected and all(path == "a.py" for _, path in selected)
+    assert len(stub_rag.format_context(selected)) <= 900
+    text = long_file("alpha").split("\n")
+    for fragment, _ in selected:
+        lines = fragment.split("\n")
+        start = text.index(lines[0])
+        assert lines == text[start:start + len(lines)]
+
+
+def test_select_excludes_changed_files_and_dedups(stub_rag):
+    stub_rag.index_stream(iter([("a.py", None, long_file("alpha")), ("b.py", None, long_file("alpha beta"))]))
+    assert all(p == "b.py" for _, p in stub_rag.select("alpha", 10_000, changed_paths={"a.py"}, changed_weight=0))
+    # Все чанки a.py — почти дубликаты друг друга: берётся только первый.
+    deduped = stub_rag.select("alpha", 10_000, changed_paths={"b.py"}, changed_weight=0, dedup_threshold=0.99)
+    assert len(deduped) == 1
+
+
+def test_select_contained_chunk_does_not_use_top_k(stub_rag):
+    stub_rag.chunks = [("alpha 0\nalpha 1\nalpha 2", "a.py"), ("alpha 1", "a.py"), ("gamma", "b.py")]
+    stub_rag.spans = [(0, 3), (1, 2), (0, 1)]
+    emb = np.array([[1, 0, 0, 0, 0], [0.9, 0.1, 0, 0, 0], [0.5, 0, 0.5, 0, 0]], dtype=np.float32)
+    stub_rag.embeddings = emb / np.linalg.norm(emb, axis=1, keepdims=True)
+    selected = stub_rag.select("alpha", 10_000, top_k=2, mmr_lambda=1.0, dedup_threshold=1.1)
+    assert selected == [("alpha 0\nalpha 1\nalpha 2", "a.py"), ("gamma", "b.py")]
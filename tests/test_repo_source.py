@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import subprocess
+
+import pytest
+
+from repo_source import GitMirrorSource
+
+
+def git(cwd, *args: str) -> str:
+    cmd = ["git", "-c", "user.name=t", "-c", "user.email=t@t", *args]
+    return subprocess.run(cmd, cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture
+def remote(tmp_path):
+    repo = tmp_path / "remote"
+    repo.mkdir()
+    git(repo, "init", "-q", "-b", "main")
+    (repo / "sp ace.py").write_text("a\nb\nc\n")
+    (repo / "old.md").write_text("readme\n" * 5)
+    (repo / "gone.py").write_text("x = 1\n")
+    git(repo, "add", "-A")
+    git(repo, "commit", "-qm", "base")
+    base = git(repo, "rev-parse", "HEAD")
+    git(repo, "mv", "old.md", "new.md")
+    git(repo, "rm", "-q", "gone.py")
+    (repo / "added.py").write_text("y = 2\n")
+    (repo / "sp ace.py").write_text("a\nB\nc\n")
+    git(repo, "add", "-A")
+    git(repo, "commit", "-qm", "head")
+    head = git(repo, "rev-parse", "HEAD")
+    return repo, base, head
+
+
+def test_list_files_with_spaces(tmp_path, remote):
+    repo, _, _ = remote
+    source = GitMirrorSource(str(tmp_path / "mirrors"), str(repo))
+    files = dict(source.list_files("1", "main"))
+    assert set(files) == {"sp ace.py", "new.md", "added.py"}
+    assert files["sp ace.py"] == git(repo, "rev-parse", "HEAD:sp ace.py")
+
+
+def test_iter_files_skips_missing_blob(tmp_path, remote):
+    repo, _, _ = remote
+    source = GitMirrorSource(str(tmp_path / "mirrors"), str(repo))
+    files = source.list_files("1", "main") + [("missing.py", "0" * 40), ("added.py", None)]
+    got = {path: content for path, _, content in source.iter_files("1", files, "main")}
+    assert got == {"sp ace.py": "a\nB\nc\n", "new.md": "readme\n" * 5, "added.py": "y = 2\n"}
+
+
+def test_merge_request_diffs(tmp_path, remote):
+    repo, base, head = remote
+    source = GitMirrorSource(str(tmp_path / "mirrors"), str(repo))
+    refs = {"base_sha": base, "head_sha": head}
+    diffs, diff_refs = source.get_merge_request_diffs("1", 1, {"diff_refs": refs})
+    assert diff_refs == refs
+    by_path = {d["new_path"]: d for d in diffs}
+    assert by_path["new.md"]["renamed_file"] and by_path["new.md"]["old_path"] == "old.md"
+    assert by_path["new.md"]["diff"] == ""
+    assert by_path["gone.py"]["deleted_file"] and by_path["gone.py"]["diff"] == "@@ -1 +0,0 @@\n-x = 1\n"
+    assert by_path["added.py"]["new_file"] and by_path["added.py"]["diff"] == "@@ -0,0 +1 @@\n+y = 2\n"
+    assert by_path["sp ace.py"]["diff"] == "@@ -1,3 +1,3 @@\n a\n-b\n+B\n c\n"
+
+
+def test_merge_request_diffs_without_refs(tmp_path, remote):
+    repo, _, _ = remote
+    source = GitMirrorSource(str(tmp_path / "mirrors"), str(repo))
+    with pytest.raises(RuntimeError):
+        source.get_merge_request_diffs("1", 1, {})
+
+
+def test_mirror_per_remote(tmp_path, remote):
+    repo, _, _ = remote
+    other = tmp_path / "other"
+    other.mkdir()
+    git(other, "init", "-q", "-b", "main")
+    (other / "other.py").write_text("z\n")
+    git(other, "add", "-A")
+    git(other, "commit", "-qm", "other")
+    mirrors = str(tmp_path / "mirrors")
+    assert {p for p, _ in GitMirrorSource(mirrors, str(repo)).list_files("1", "main")} == {"sp ace.py", "new.md", "added.py"}
+    assert [p for p, _ in GitMirrorSource(mirrors, str(other)).list_files("1", "main")] == ["other.py"]
+
+
+def test_sync_fetches_new_commits(tmp_path, remote):
+    repo, _, _ = remote
+    mirrors = str(tmp_path / "mirrors")
+    GitMirrorSource(mirrors, str(repo)).sync("1")
+    (repo / "later.py").write_text("later\n")
+    git(repo, "add", "-A")
+    git(repo, "commit", "-qm", "later")
+    assert "later.py" in dict(GitMirrorSource(mirrors, str(repo)).list_files("1", "main"))
+
+
+def test_token_only_in_env_for_http_remotes(tmp_path):
+    source = GitMirrorSource(str(tmp_path), "http://gitlab.local/g/p.git", "secret")
+    env = source._auth_env()
+    assert env["GIT_CONFIG_KEY_0"] == "http.extraHeader"
+    assert env["GIT_CONFIG_VALUE_0"].startswith("Authorization: Basic ")
+    assert GitMirrorSource(str(tmp_path), "/srv/repo", "secret")._auth_env() is None
+
+
+def test_merge_request_diffs_type_change_keeps_patches_aligned(tmp_path):
+    repo = tmp_path / "remote"
+    repo.mkdir()
+    git(repo, "init", "-q", "-b", "main")
+    (repo / "z.py").write_text("x\n")
+    (repo / 'q"t.py').write_text("1\n")
+    git(repo, "add", "-A")
+    git(repo, "commit", "-qm", "base")
+    base = git(repo, "rev-parse", "HEAD")
+    (repo / "z.py").unlink()
+    (repo / "z.py").symlink_to("target")
+    (repo / 'q"t.py').write_text("2\n")
+    (repo / "zz.py").write_text("new\n")
+    git(repo, "add", "-A")
+    git(repo, "commit", "-qm", "head")
+    head = git(repo, "rev-parse", "HEAD")
+
+    source = GitMirrorSource(str(tmp_path / "mirrors"), str(repo))
+    diffs, _ = source.get_merge_request_diffs("1", 1, {"diff_refs": {"base_sha": base, "head_sha": head}})
+    by_path = {d["new_path"]: d["diff"] for d in diffs}
+    assert by_path["z.py"] == "@@ -1 +0,0 @@\n-x\n@@ -0,0 +1 @@\n+target\n\\ No newline at end of file\n"
+    assert by_path["zz.py"] == "@@ -0,0 +1 @@\n+new\n"
+    assert by_path['q"t.py'] == "@@ -1 +1 @@\n-1\n+2\n"
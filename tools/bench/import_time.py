@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Бенчмарк старта: время импорта модулей по python -X importtime и время main.py --help.
+
+python tools/bench/import_time.py [--modules main api reviewer] [--top 10] [--max-ms 300]
+С --max-ms завершается с кодом 1, если импорт main дольше порога.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def import_times(module: str) -> list[tuple[str, int, int]]:
+    """(пакет, self_us, cumulative_us) для всех импортов при `import module`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        raise RuntimeError(f"import {module}: {lines[-1] if lines else f'код выхода {proc.returncode}'}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def help_wall_ms() -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "main.py", "--help"], cwd=ROOT, capture_output=True, check=False)
+    return (time.perf_counter() - started) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import-time benchmark")
+    parser.add_argument("--modules", nargs="+", default=["main", "api", "reviewer"])
+    parser.add_argument("--top", type=int, default=10, help="Сколько самых тяжёлых импортов показать")
+    parser.add_argument("--max-ms", type=float, default=None, help="Порог для импорта main, мс")
+    args = parser.parse_args()
+
+    main_ms = None
+    for module in args.modules:
+        try:
+            rows = import_times(module)
+        except RuntimeError as e:
+            print(f"{module}: {e}")
+            continue
+        total = next((cum for name, _, cum in rows if name.strip() == module), 0)
+        print(f"{module}: {total / 1000:.1f} ms, модулей={len(rows)}")
+        top_level = [r for r in rows if not r[0].startswith("  ")]
+        for name, _, cum in sorted(top_level, key=lambda r: r[2], reverse=True)[: args.top]:
+            print(f"  {cum / 1000:8.1f} ms  {name.strip()}")
+        if module == "main":
+            main_ms = total / 1000
+    print(f"main.py --help: {help_wall_ms():.1f} ms")
+
+    if args.max_ms is not None and main_ms is not None and main_ms > args.max_ms:
+        print(f"Импорт main {main_ms:.1f} ms > {args.max_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()